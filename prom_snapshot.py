@@ -5,87 +5,177 @@ Captures and compares Prometheus metrics across platform releases.
 """
 
 import argparse
+import concurrent.futures
+import contextlib
+import functools
+import hashlib
 import json
 import os
+import re
 import subprocess
 import sys
+import threading
 import time
 from datetime import datetime
 from pathlib import Path
 
-import requests
-import yaml
+# requests and yaml are imported lazily where used, so `--help` and listing
+# JSON snapshots don't pay their import cost
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Constants
 SCRIPT_DIR = Path(__file__).parent.resolve()
 SNAPSHOTS_DIR = SCRIPT_DIR / "snapshots"
 CONFIG_FILE = SCRIPT_DIR / "config.yaml"
+WORKSPACE_ROOT = "/workspaces/glueops"
 DEFAULT_PROM_NAMESPACE = "glueops-core-kube-prometheus-stack"
 DEFAULT_PROM_SERVICE = "prometheus-operated"
 DEFAULT_PROM_PORT = 9090
+PORT_FORWARD_TIMEOUT = 25
+SNAPSHOT_SUFFIXES = (".json", ".yaml", ".yml")
+META_CACHE_NAME = ".meta_cache.json"
+
+# Metric names that can be written as plain YAML scalars without the emitter
+PLAIN_METRIC_RE = re.compile(r"[A-Za-z_:][A-Za-z0-9_:]*")
+YAML_RESERVED_WORDS = {"true", "false", "yes", "no", "on", "off", "null", "y", "n", "empty"}
+
+# Elements compared per slice when looking for matching runs in diff_sorted()
+DIFF_RUN_LENGTH = 32
+
+# Snapshot metadata keyed by file name: {"key": [mtime_ns, size, ino], "metadata": {...}}
+_SNAP_META_CACHE: dict = {}
+
+
+def yaml_load(stream):
+    """Parse YAML with the libyaml C loader when available."""
+    import yaml
+    try:
+        from yaml import CSafeLoader as Loader
+    except ImportError:
+        from yaml import SafeLoader as Loader
+    return yaml.load(stream, Loader=Loader)
+
+
+def yaml_dump(data, stream, **kwargs):
+    """Dump YAML with the libyaml C dumper when available."""
+    import yaml
+    try:
+        from yaml import CSafeDumper as Dumper
+    except ImportError:
+        from yaml import SafeDumper as Dumper
+    return yaml.dump(data, stream, Dumper=Dumper, **kwargs)
+
+
+@functools.lru_cache(maxsize=1)
+def get_http_session():
+    """Return a shared HTTP session so repeated fetches reuse the connection."""
+    import requests
+    session = requests.Session()
+    session.headers.update({"Accept-Encoding": "gzip"})
+    return session
 
 
 def load_config():
     """Load configuration from config.yaml if exists."""
-    if CONFIG_FILE.exists():
-        with open(CONFIG_FILE) as f:
-            return yaml.safe_load(f)
-    return {}
+    try:
+        st = CONFIG_FILE.stat()
+    except FileNotFoundError:
+        return {}
+    # Shallow copy so callers can't mutate the cached config
+    return dict(_load_config_cached((st.st_mtime_ns, st.st_size, st.st_ino)))
 
 
-def get_platform_version(cluster_path: str = None) -> dict:
-    """Read platform version from VERSIONS/glueops.yaml."""
+@functools.lru_cache(maxsize=1)
+def _load_config_cached(stat_key: tuple) -> dict:
+    """Parse config.yaml; cached on its (mtime_ns, size, ino) stat key."""
+    with open(CONFIG_FILE) as f:
+        return yaml_load(f) or {}
+
+
+def _iter_version_files(cluster_path: str = None):
+    """Yield candidate VERSIONS/glueops.yaml paths, most specific first."""
+    if cluster_path:
+        yield Path(cluster_path) / "VERSIONS" / "glueops.yaml"
+    
+    # Also check common locations
+    yield Path(WORKSPACE_ROOT) / os.environ.get("CLUSTER", "") / "VERSIONS" / "glueops.yaml"
+    yield Path.cwd() / "VERSIONS" / "glueops.yaml"
+    
+    # Auto-detect cluster directories (DirEntry.is_dir() avoids an extra stat);
+    # hidden directories are skipped, as glob("*") did
+    try:
+        with os.scandir(WORKSPACE_ROOT) as entries:
+            for entry in entries:
+                if not entry.name.startswith(".") and entry.is_dir():
+                    yield Path(entry.path) / "VERSIONS" / "glueops.yaml"
+    except OSError:
+        return
+
+
+@functools.lru_cache(maxsize=None)
+def _read_version_file(version_file: str, mtime_ns: int) -> dict:
+    """Parse a VERSIONS/glueops.yaml file; cached on its path and mtime."""
     version_info = {
         "platform_version": "unknown",
         "argocd_version": "unknown",
         "codespace_version": "unknown"
     }
     
-    # Try to find VERSIONS directory
-    search_paths = []
-    if cluster_path:
-        search_paths.append(Path(cluster_path) / "VERSIONS" / "glueops.yaml")
-    
-    # Also check common locations
-    search_paths.extend([
-        Path("/workspaces/glueops") / os.environ.get("CLUSTER", "") / "VERSIONS" / "glueops.yaml",
-        Path.cwd() / "VERSIONS" / "glueops.yaml",
-    ])
-    
-    # Auto-detect cluster directories
-    workspace_root = Path("/workspaces/glueops")
-    if workspace_root.exists():
-        for versions_file in workspace_root.glob("*/VERSIONS/glueops.yaml"):
-            search_paths.append(versions_file)
-
-    for version_file in search_paths:
-        if version_file.exists():
-            try:
-                with open(version_file) as f:
-                    data = yaml.safe_load(f)
-                    # Handle versions array format
-                    if "versions" in data:
-                        for item in data["versions"]:
-                            name = item.get("name", "")
-                            version = item.get("version", "unknown")
-                            if name == "glueops_platform_helm_chart_version":
-                                version_info["platform_version"] = version
-                            elif name == "argocd_app_version":
-                                version_info["argocd_version"] = version
-                            elif name == "codespace_version":
-                                version_info["codespace_version"] = version
-                    else:
-                        # Fallback to flat format
-                        version_info["platform_version"] = data.get("glueops_platform_helm_chart_version", "unknown")
-                        version_info["argocd_version"] = data.get("argocd_app_version", "unknown")
-                        version_info["codespace_version"] = data.get("codespace_version", "unknown")
-                    break
-            except Exception as e:
-                print(f"Warning: Could not read {version_file}: {e}", file=sys.stderr)
+    with open(version_file) as f:
+        data = yaml_load(f)
+    
+    # Handle versions array format
+    if "versions" in data:
+        for item in data["versions"]:
+            name = item.get("name", "")
+            version = item.get("version", "unknown")
+            if name == "glueops_platform_helm_chart_version":
+                version_info["platform_version"] = version
+            elif name == "argocd_app_version":
+                version_info["argocd_version"] = version
+            elif name == "codespace_version":
+                version_info["codespace_version"] = version
+    else:
+        # Fallback to flat format
+        version_info["platform_version"] = data.get("glueops_platform_helm_chart_version", "unknown")
+        version_info["argocd_version"] = data.get("argocd_app_version", "unknown")
+        version_info["codespace_version"] = data.get("codespace_version", "unknown")
     
     return version_info
 
 
+def get_platform_version(cluster_path: str = None) -> dict:
+    """Read platform version from VERSIONS/glueops.yaml."""
+    seen = set()
+    
+    # Candidates are generated lazily, so nothing past the first hit is scanned
+    for version_file in _iter_version_files(cluster_path):
+        version_file = os.path.abspath(version_file)
+        if version_file in seen:
+            continue
+        seen.add(version_file)
+        
+        try:
+            st = os.stat(version_file)
+        except OSError:
+            continue
+        
+        try:
+            return dict(_read_version_file(version_file, st.st_mtime_ns))
+        except Exception as e:
+            print(f"Warning: Could not read {version_file}: {e}", file=sys.stderr)
+    
+    return {
+        "platform_version": "unknown",
+        "argocd_version": "unknown",
+        "codespace_version": "unknown"
+    }
+
+
 def get_captain_domain() -> str:
     """Get captain domain from environment or saved_variables."""
     # Check environment
@@ -113,44 +203,134 @@ def start_port_forward(namespace: str, service: str, local_port: int, remote_por
     
     proc = subprocess.Popen(
         cmd,
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.DEVNULL
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True
     )
     
+    # kubectl announces "Forwarding from 127.0.0.1:<port>" once it has bound
+    # the local port. A plain TCP probe could hit some other process already
+    # listening there while kubectl fails to bind and exits.
+    ready = threading.Event()
+    
+    def read_output():
+        # Keep draining stdout after startup so kubectl never blocks on a full pipe
+        for line in proc.stdout:
+            if line.startswith(f"Forwarding from 127.0.0.1:{local_port}"):
+                ready.set()
+    
+    threading.Thread(target=read_output, daemon=True).start()
+    
     # Wait for port-forward to be ready
-    time.sleep(25)
+    deadline = time.monotonic() + PORT_FORWARD_TIMEOUT
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Failed to start port-forward to {namespace}/{service}")
+        if ready.wait(0.1):
+            if proc.poll() is not None:
+                raise RuntimeError(f"Failed to start port-forward to {namespace}/{service}")
+            return proc
     
-    if proc.poll() is not None:
-        raise RuntimeError(f"Failed to start port-forward to {namespace}/{service}")
+    proc.terminate()
+    proc.wait()
+    raise RuntimeError(f"Timed out waiting for port-forward to {namespace}/{service}")
+
+
+class PortForward:
+    """Keep a kubectl port-forward open for the duration of a with-block."""
     
-    return proc
+    def __init__(self, namespace: str, service: str, local_port: int, remote_port: int):
+        self.namespace = namespace
+        self.service = service
+        self.local_port = local_port
+        self.remote_port = remote_port
+        self.proc = None
+    
+    @property
+    def url(self) -> str:
+        return f"http://localhost:{self.local_port}"
+    
+    def __enter__(self):
+        print(f"Starting port-forward to {self.namespace}/{self.service}:{self.remote_port}...", file=sys.stderr)
+        self.proc = start_port_forward(self.namespace, self.service, self.local_port, self.remote_port)
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        if self.proc:
+            self.proc.terminate()
+            self.proc.wait()
+            self.proc = None
+
+
+@contextlib.contextmanager
+def prometheus_connection(args, namespace: str, service: str, port: int):
+    """Yield a Prometheus base URL, port-forwarding unless --url was given."""
+    if args.url:
+        yield args.url.rstrip("/")
+        return
+    
+    with PortForward(namespace, service, port, port) as port_forward:
+        yield port_forward.url
 
 
 def fetch_metrics(prometheus_url: str) -> list:
     """Fetch all metric names from Prometheus."""
+    import requests
+    
     url = f"{prometheus_url}/api/v1/label/__name__/values"
     
     try:
-        response = requests.get(url, timeout=30)
+        response = get_http_session().get(url, timeout=30)
         response.raise_for_status()
-        data = response.json()
+        data = orjson.loads(response.content) if orjson else response.json()
         
         if data.get("status") != "success":
             raise RuntimeError(f"Prometheus API error: {data}")
         
-        return sorted(data.get("data", []))
+        metrics = data.get("data", [])
+        metrics.sort()
+        return metrics
     
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, ValueError) as e:
+        # ValueError covers undecodable bodies from both orjson and response.json()
         raise RuntimeError(f"Failed to fetch metrics: {e}")
 
 
+def metrics_fingerprint(metrics: list) -> str:
+    """Return a stable fingerprint of a metrics list."""
+    return hashlib.sha256("\n".join(metrics).encode()).hexdigest()
+
+
+def write_yaml_metrics(metrics: list, f):
+    """Write the metrics list as a YAML block sequence.
+    
+    Prometheus names are written plain without the emitter; anything else
+    goes through yaml_dump so quoting and escaping follow YAML's own rules.
+    """
+    if not metrics:
+        f.write("metrics: []\n")
+        return
+    
+    lines = ["metrics:"]
+    for metric in metrics:
+        if (PLAIN_METRIC_RE.fullmatch(metric) and not metric.endswith(":")
+                and metric.lower() not in YAML_RESERVED_WORDS):
+            lines.append(f"- {metric}")
+        else:
+            # A one-item top-level sequence is a valid item of the metrics list
+            lines.append(yaml_dump([metric], None, default_flow_style=False, allow_unicode=True).rstrip("\n"))
+    f.write("\n".join(lines) + "\n")
+
+
 def save_snapshot(metrics: list, output_file: Path, metadata: dict):
-    """Save metrics snapshot to YAML file."""
+    """Save metrics snapshot to JSON file (or YAML for .yaml/.yml paths)."""
     snapshot = {
         "metadata": {
             **metadata,
             "timestamp": datetime.utcnow().isoformat() + "Z",
-            "metrics_count": len(metrics)
+            "metrics_count": len(metrics),
+            "metrics_sha256": metrics_fingerprint(metrics),
+            "sorted": metrics == sorted(metrics)
         },
         "metrics": metrics
     }
@@ -158,25 +338,204 @@ def save_snapshot(metrics: list, output_file: Path, metadata: dict):
     output_file.parent.mkdir(parents=True, exist_ok=True)
     
     with open(output_file, "w") as f:
-        yaml.dump(snapshot, f, default_flow_style=False, allow_unicode=True, sort_keys=False)
+        if output_file.suffix in (".yaml", ".yml"):
+            yaml_dump({"metadata": snapshot["metadata"]}, f, default_flow_style=False, allow_unicode=True, sort_keys=False)
+            write_yaml_metrics(metrics, f)
+        else:
+            json.dump(snapshot, f, indent=2)
+            f.write("\n")
     
     return snapshot
 
 
 def load_snapshot(snapshot_file: Path) -> dict:
-    """Load snapshot from YAML file."""
+    """Load snapshot from JSON or legacy YAML file."""
     with open(snapshot_file) as f:
-        return yaml.safe_load(f)
+        if snapshot_file.suffix == ".json":
+            return json.load(f)
+        return yaml_load(f)
+
+
+def load_snapshot_metadata(snapshot_file: Path) -> dict:
+    """Load only the metadata block of a snapshot.
+    
+    YAML snapshots are written with metadata first, so parsing stops at the
+    top-level "metrics:" key instead of building the full metrics list.
+    """
+    if snapshot_file.suffix == ".json":
+        return load_snapshot(snapshot_file).get("metadata", {})
+    
+    header = []
+    with open(snapshot_file) as f:
+        for line in f:
+            if line.startswith("metrics:"):
+                break
+            header.append(line)
+    
+    data = yaml_load("".join(header)) or {}
+    if "metadata" not in data:
+        # Metadata not ahead of metrics; fall back to a full parse
+        return load_snapshot(snapshot_file).get("metadata", {})
+    return data["metadata"]
+
+
+def _iter_snapshot_entries():
+    """Yield (path, stat) for each snapshot file in SNAPSHOTS_DIR."""
+    with os.scandir(SNAPSHOTS_DIR) as entries:
+        for entry in entries:
+            if entry.name.startswith(".") or os.path.splitext(entry.name)[1] not in SNAPSHOT_SUFFIXES:
+                continue
+            if not entry.is_file():
+                continue
+            # DirEntry caches its stat, so each file is stat'ed once
+            yield Path(entry.path), entry.stat()
+
+
+def scan_snapshots() -> list:
+    """Return (path, stat) for snapshot files in SNAPSHOTS_DIR, newest first."""
+    return sorted(_iter_snapshot_entries(), key=lambda item: item[1].st_mtime_ns, reverse=True)
+
+
+def latest_snapshot() -> Path:
+    """Return the most recently modified snapshot file, or None."""
+    latest = max(_iter_snapshot_entries(), key=lambda item: item[1].st_mtime_ns, default=None)
+    return latest[0] if latest else None
+
+
+def _is_meta_cache_entry(entry) -> bool:
+    """Check a metadata cache entry has the {"key": [...], "metadata": {...}} shape."""
+    return (
+        isinstance(entry, dict)
+        and isinstance(entry.get("key"), list)
+        and isinstance(entry.get("metadata"), dict)
+    )
+
+
+def load_meta_cache() -> dict:
+    """Load the persisted snapshot metadata cache into memory."""
+    try:
+        with open(SNAPSHOTS_DIR / META_CACHE_NAME) as f:
+            on_disk = json.load(f)
+    except (OSError, ValueError):
+        on_disk = {}
+    if not isinstance(on_disk, dict):
+        on_disk = {}
+    # Malformed entries are dropped here, so they are re-read and rewritten
+    _SNAP_META_CACHE.update(
+        (name, entry) for name, entry in on_disk.items() if _is_meta_cache_entry(entry)
+    )
+    return on_disk
+
+
+def save_meta_cache(names: set, on_disk: dict):
+    """Persist cached metadata for the named snapshots, dropping stale entries."""
+    cache = {name: entry for name, entry in _SNAP_META_CACHE.items() if name in names}
+    if cache == on_disk:
+        return
+    
+    # Write to a temp file and swap it in, so a failed write never leaves a
+    # truncated cache behind
+    tmp_file = SNAPSHOTS_DIR / f"{META_CACHE_NAME}.tmp"
+    try:
+        data = json.dumps(cache)
+        with open(tmp_file, "w") as f:
+            f.write(data)
+        os.replace(tmp_file, SNAPSHOTS_DIR / META_CACHE_NAME)
+    except (OSError, TypeError, ValueError) as e:
+        print(f"Warning: Could not write metadata cache: {e}", file=sys.stderr)
+        with contextlib.suppress(OSError):
+            tmp_file.unlink()
+
+
+def _load_snapshot_metadata_only(snapshot_file: Path, st: os.stat_result = None) -> dict:
+    """Return snapshot metadata, re-parsing the file only if it changed on disk."""
+    if st is None:
+        st = snapshot_file.stat()
+    key = [st.st_mtime_ns, st.st_size, st.st_ino]
+    
+    cached = _SNAP_META_CACHE.get(snapshot_file.name)
+    if _is_meta_cache_entry(cached) and cached["key"] == key:
+        return cached["metadata"]
+    
+    metadata = load_snapshot_metadata(snapshot_file)
+    
+    # YAML can yield values JSON can't hold (e.g. an unquoted timestamp loads
+    # as datetime); such metadata is simply re-read next time
+    try:
+        json.dumps(metadata)
+    except (TypeError, ValueError):
+        return metadata
+    
+    _SNAP_META_CACHE[snapshot_file.name] = {"key": key, "metadata": metadata}
+    return metadata
+
+
+def diff_sorted(metrics_a: list, metrics_b: list) -> tuple:
+    """Two-pointer diff of sorted metric lists.
+    
+    Returns (common, only_in_a, only_in_b), each sorted.
+    """
+    common, only_in_a, only_in_b = [], [], []
+    i = j = 0
+    len_a, len_b = len(metrics_a), len(metrics_b)
+    
+    while i < len_a and j < len_b:
+        # Snapshots mostly agree, so first try to match a whole run at once
+        # (slice comparison runs in C) before stepping element by element
+        run = metrics_a[i:i + DIFF_RUN_LENGTH]
+        if run == metrics_b[j:j + DIFF_RUN_LENGTH]:
+            common.extend(run)
+            i += len(run)
+            j += len(run)
+            continue
+        
+        run_end = min(i + DIFF_RUN_LENGTH, len_a)
+        while i < run_end and j < len_b:
+            a, b = metrics_a[i], metrics_b[j]
+            if a == b:
+                common.append(a)
+                i += 1
+                j += 1
+            elif a < b:
+                only_in_a.append(a)
+                i += 1
+            else:
+                only_in_b.append(b)
+                j += 1
+    
+    only_in_a.extend(metrics_a[i:])
+    only_in_b.extend(metrics_b[j:])
+    return common, only_in_a, only_in_b
 
 
 def compare_snapshots(snapshot_a: dict, snapshot_b: dict) -> dict:
     """Compare two snapshots and return differences."""
-    metrics_a = set(snapshot_a.get("metrics", []))
-    metrics_b = set(snapshot_b.get("metrics", []))
+    metrics_a = snapshot_a.get("metrics", [])
+    metrics_b = snapshot_b.get("metrics", [])
+    meta_a = snapshot_a.get("metadata", {})
+    meta_b = snapshot_b.get("metadata", {})
+    
+    # Trust matching fingerprints only if the lists still match what was
+    # saved; a hand-edited snapshot falls through to a real diff
+    same_fingerprint = (
+        meta_a.get("metrics_sha256")
+        and meta_a.get("metrics_sha256") == meta_b.get("metrics_sha256")
+        and len(metrics_a) == len(metrics_b)
+        and meta_a.get("metrics_count") == len(metrics_a)
+        and meta_b.get("metrics_count") == len(metrics_b)
+    )
     
-    common = sorted(metrics_a & metrics_b)
-    only_in_a = sorted(metrics_a - metrics_b)
-    only_in_b = sorted(metrics_b - metrics_a)
+    if same_fingerprint:
+        # Identical metric sets; nothing to diff
+        common, only_in_a, only_in_b = sorted(metrics_a), [], []
+    elif meta_a.get("sorted") and meta_b.get("sorted"):
+        common, only_in_a, only_in_b = diff_sorted(metrics_a, metrics_b)
+    else:
+        # Legacy snapshots carry no "sorted" tag; fall back to set operations
+        set_a, set_b = set(metrics_a), set(metrics_b)
+        common = sorted(set_a & set_b)
+        only_in_a = sorted(set_a - set_b)
+        only_in_b = sorted(set_b - set_a)
     
     return {
         "comparison": {
@@ -204,63 +563,156 @@ def compare_snapshots(snapshot_a: dict, snapshot_b: dict) -> dict:
     }
 
 
-def cmd_snapshot(args):
-    """Take a snapshot of current Prometheus metrics."""
+def metric_bitmaps(snapshots: list) -> tuple:
+    """Encode each snapshot's metrics as an int bitmap over a shared vocabulary.
+    
+    Returns (vocab, bitmaps), where bit i of a bitmap stands for vocab[i].
+    The vocabulary is sorted, so decoded metric lists come out sorted.
+    """
+    vocab = sorted(set().union(*(snap.get("metrics", []) for snap in snapshots)))
+    index = {metric: i for i, metric in enumerate(vocab)}
+    
+    bitmaps = []
+    for snap in snapshots:
+        bits = bytearray((len(vocab) + 7) // 8)
+        for metric in snap.get("metrics", []):
+            i = index[metric]
+            bits[i >> 3] |= 1 << (i & 7)
+        bitmaps.append(int.from_bytes(bits, "little"))
+    
+    return vocab, bitmaps
+
+
+def bitmap_metrics(bitmap: int, vocab: list) -> list:
+    """Decode a metric bitmap back into the (sorted) metric names it holds."""
+    metrics = []
+    for byte_index, byte in enumerate(bitmap.to_bytes((len(vocab) + 7) // 8, "little")):
+        while byte:
+            low = byte & -byte
+            metrics.append(vocab[(byte_index << 3) + low.bit_length() - 1])
+            byte ^= low
+    return metrics
+
+
+def compare_matrix(snapshots: list) -> tuple:
+    """Compare every pair of snapshots using bitmap AND / AND-NOT.
+    
+    Returns (vocab, pairs); each pair holds the indexes of both snapshots,
+    the common/unique counts and the bitmaps of the unique metrics.
+    """
+    vocab, bitmaps = metric_bitmaps(snapshots)
+    
+    pairs = []
+    for i in range(len(snapshots)):
+        for j in range(i + 1, len(snapshots)):
+            only_a = bitmaps[i] & ~bitmaps[j]
+            only_b = bitmaps[j] & ~bitmaps[i]
+            pairs.append({
+                "a": i,
+                "b": j,
+                "common_metrics": bin(bitmaps[i] & bitmaps[j]).count("1"),
+                "unique_to_a": bin(only_a).count("1"),
+                "unique_to_b": bin(only_b).count("1"),
+                "only_a_bitmap": only_a,
+                "only_b_bitmap": only_b
+            })
+    
+    return vocab, pairs
+
+
+def print_json(data):
+    """Print data as indented JSON, using orjson when available."""
+    if orjson:
+        sys.stdout.flush()
+        sys.stdout.buffer.write(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE))
+        sys.stdout.buffer.flush()
+    else:
+        print(json.dumps(data, indent=2))
+
+
+def take_snapshot(args, prometheus_url: str, namespace: str, output_file: Path = None) -> tuple:
+    """Fetch metrics and save a snapshot; returns (output_file, snapshot)."""
+    print(f"Fetching metrics from {prometheus_url}...", file=sys.stderr)
+    metrics = fetch_metrics(prometheus_url)
+    print(f"Found {len(metrics)} metrics", file=sys.stderr)
+    
+    # Gather metadata
+    version_info = get_platform_version(args.cluster_path)
+    metadata = {
+        "platform_version": version_info["platform_version"],
+        "argocd_version": version_info["argocd_version"],
+        "codespace_version": version_info["codespace_version"],
+        "captain_domain": get_captain_domain(),
+        "prometheus_namespace": namespace
+    }
+    
+    # Generate output filename
+    if output_file is None:
+        version_slug = version_info["platform_version"].replace(".", "-")
+        timestamp = datetime.utcnow().strftime("%Y-%m-%dT%H-%M-%S")
+        output_file = SNAPSHOTS_DIR / f"{version_slug}_{timestamp}.json"
+    
+    # Save snapshot
+    snapshot = save_snapshot(metrics, output_file, metadata)
+    
+    print(f"\n✅ Snapshot saved: {output_file}", file=sys.stderr)
+    print(f"   Platform version: {metadata['platform_version']}", file=sys.stderr)
+    print(f"   Metrics count: {len(metrics)}", file=sys.stderr)
+    
+    return output_file, snapshot
+
+
+def _prometheus_target(args) -> tuple:
+    """Resolve (namespace, service, port) from args, config.yaml and defaults."""
     config = load_config()
     
     namespace = args.namespace or config.get("prometheus_namespace", DEFAULT_PROM_NAMESPACE)
     service = args.service or config.get("prometheus_service", DEFAULT_PROM_SERVICE)
     port = args.port or config.get("prometheus_port", DEFAULT_PROM_PORT)
+    return namespace, service, port
+
+
+def cmd_snapshot(args):
+    """Take a snapshot of current Prometheus metrics."""
+    namespace, service, port = _prometheus_target(args)
+    output_file = Path(args.output) if args.output else None
     
-    port_forward_proc = None
+    with prometheus_connection(args, namespace, service, port) as prometheus_url:
+        _, snapshot = take_snapshot(args, prometheus_url, namespace, output_file)
+    
+    if args.json:
+        print_json(snapshot)
+    
+    return 0
+
+
+def cmd_snapshot_many(args):
+    """Take repeated snapshots over a single port-forward."""
+    if args.every < 1:
+        print("Error: --every must be at least 1 second", file=sys.stderr)
+        return 1
+    
+    if args.count is not None and args.count < 1:
+        print("Error: --count must be at least 1", file=sys.stderr)
+        return 1
+    
+    namespace, service, port = _prometheus_target(args)
+    taken = 0
     
     try:
-        # Start port-forward if not using external URL
-        if args.url:
-            prometheus_url = args.url.rstrip("/")
-        else:
-            print(f"Starting port-forward to {namespace}/{service}:{port}...", file=sys.stderr)
-            port_forward_proc = start_port_forward(namespace, service, port, port)
-            prometheus_url = f"http://localhost:{port}"
-        
-        print(f"Fetching metrics from {prometheus_url}...", file=sys.stderr)
-        metrics = fetch_metrics(prometheus_url)
-        print(f"Found {len(metrics)} metrics", file=sys.stderr)
-        
-        # Gather metadata
-        version_info = get_platform_version(args.cluster_path)
-        metadata = {
-            "platform_version": version_info["platform_version"],
-            "argocd_version": version_info["argocd_version"],
-            "codespace_version": version_info["codespace_version"],
-            "captain_domain": get_captain_domain(),
-            "prometheus_namespace": namespace
-        }
-        
-        # Generate output filename
-        if args.output:
-            output_file = Path(args.output)
-        else:
-            version_slug = version_info["platform_version"].replace(".", "-")
-            timestamp = datetime.utcnow().strftime("%Y-%m-%dT%H-%M-%S")
-            output_file = SNAPSHOTS_DIR / f"{version_slug}_{timestamp}.yaml"
-        
-        # Save snapshot
-        snapshot = save_snapshot(metrics, output_file, metadata)
-        
-        print(f"\n✅ Snapshot saved: {output_file}", file=sys.stderr)
-        print(f"   Platform version: {metadata['platform_version']}", file=sys.stderr)
-        print(f"   Metrics count: {len(metrics)}", file=sys.stderr)
-        
-        if args.json:
-            print(json.dumps(snapshot, indent=2))
-        
-        return 0
+        with prometheus_connection(args, namespace, service, port) as prometheus_url:
+            while args.count is None or taken < args.count:
+                if taken:
+                    time.sleep(args.every)
+                take_snapshot(args, prometheus_url, namespace)
+                taken += 1
+    except KeyboardInterrupt:
+        print(f"\nStopped after {taken} snapshot(s)", file=sys.stderr)
+        # Without --count, Ctrl-C is the normal way to stop
+        if args.count is not None:
+            return 1
     
-    finally:
-        if port_forward_proc:
-            port_forward_proc.terminate()
-            port_forward_proc.wait()
+    return 0
 
 
 def cmd_compare(args):
@@ -269,16 +721,20 @@ def cmd_compare(args):
     snapshot_b_path = Path(args.snapshot_b)
     
     # Handle "latest" keyword
-    if args.snapshot_a == "latest" or args.snapshot_b == "latest":
-        snapshots = sorted(SNAPSHOTS_DIR.glob("*.yaml"), key=lambda p: p.stat().st_mtime, reverse=True)
-        if not snapshots:
+    if args.snapshot_a == "latest" and args.snapshot_b == "latest":
+        print("Error: Both snapshots are 'latest'; nothing to compare", file=sys.stderr)
+        return 1
+    
+    if "latest" in (args.snapshot_a, args.snapshot_b):
+        latest = latest_snapshot() if SNAPSHOTS_DIR.exists() else None
+        if latest is None:
             print("Error: No snapshots found", file=sys.stderr)
             return 1
         
         if args.snapshot_a == "latest":
-            snapshot_a_path = snapshots[0]
-        if args.snapshot_b == "latest":
-            snapshot_b_path = snapshots[0]
+            snapshot_a_path = latest
+        else:
+            snapshot_b_path = latest
     
     if not snapshot_a_path.exists():
         print(f"Error: Snapshot not found: {snapshot_a_path}", file=sys.stderr)
@@ -288,6 +744,10 @@ def cmd_compare(args):
         print(f"Error: Snapshot not found: {snapshot_b_path}", file=sys.stderr)
         return 1
     
+    if snapshot_a_path.samefile(snapshot_b_path):
+        print(f"Error: Both arguments resolve to the same snapshot: {snapshot_a_path}", file=sys.stderr)
+        return 1
+    
     snapshot_a = load_snapshot(snapshot_a_path)
     snapshot_a["_source_file"] = str(snapshot_a_path.name)
     
@@ -297,57 +757,124 @@ def cmd_compare(args):
     result = compare_snapshots(snapshot_a, snapshot_b)
     
     if args.json:
-        print(json.dumps(result, indent=2))
+        print_json(result)
     else:
         print_comparison_report(result, args.verbose)
     
     return 0
 
 
+def cmd_matrix(args):
+    """Compare every pair among several snapshots."""
+    if args.snapshots:
+        paths = [Path(p) for p in args.snapshots]
+    elif SNAPSHOTS_DIR.exists():
+        # Oldest first, so A is the earlier snapshot in each pair
+        paths = [path for path, _ in reversed(scan_snapshots())]
+    else:
+        paths = []
+    
+    if len(paths) < 2:
+        print("Error: Need at least two snapshots to compare", file=sys.stderr)
+        return 1
+    
+    for path in paths:
+        if not path.exists():
+            print(f"Error: Snapshot not found: {path}", file=sys.stderr)
+            return 1
+    
+    snapshots = [load_snapshot(path) for path in paths]
+    vocab, pairs = compare_matrix(snapshots)
+    
+    if args.json:
+        print_json([
+            {
+                "snapshot_a": paths[pair["a"]].name,
+                "snapshot_b": paths[pair["b"]].name,
+                "common_metrics": pair["common_metrics"],
+                "unique_to_a": pair["unique_to_a"],
+                "unique_to_b": pair["unique_to_b"]
+            }
+            for pair in pairs
+        ])
+        return 0
+    
+    lines = [f"\n{'Snapshot A':<40} {'Snapshot B':<40} {'Common':<8} {'Only A':<8} {'Only B'}"]
+    lines.append("-" * 110)
+    for pair in pairs:
+        lines.append(
+            f"{paths[pair['a']].name:<40} {paths[pair['b']].name:<40} "
+            f"{pair['common_metrics']:<8} {pair['unique_to_a']:<8} {pair['unique_to_b']}"
+        )
+        if args.verbose:
+            # Metric names are only decoded from the bitmaps when asked for
+            lines.extend(f"  - {metric}" for metric in bitmap_metrics(pair["only_a_bitmap"], vocab))
+            lines.extend(f"  + {metric}" for metric in bitmap_metrics(pair["only_b_bitmap"], vocab))
+    
+    sys.stdout.write("\n".join(lines) + "\n\n")
+    return 0
+
+
 def print_comparison_report(result: dict, verbose: bool = False):
     """Print human-readable comparison report."""
     comp = result["comparison"]
     
-    print("\n" + "=" * 60)
-    print("PROMETHEUS METRICS COMPARISON REPORT")
-    print("=" * 60)
+    # Collect the whole report and write it once instead of print() per line
+    lines = []
     
-    print(f"\n📊 Snapshot A: {comp['snapshot_a']['file']}")
-    print(f"   Version: {comp['snapshot_a']['version']}")
-    print(f"   Date: {comp['snapshot_a']['timestamp']}")
-    print(f"   Total metrics: {comp['snapshot_a']['total_metrics']}")
+    lines.append("\n" + "=" * 60)
+    lines.append("PROMETHEUS METRICS COMPARISON REPORT")
+    lines.append("=" * 60)
     
-    print(f"\n📊 Snapshot B: {comp['snapshot_b']['file']}")
-    print(f"   Version: {comp['snapshot_b']['version']}")
-    print(f"   Date: {comp['snapshot_b']['timestamp']}")
-    print(f"   Total metrics: {comp['snapshot_b']['total_metrics']}")
+    lines.append(f"\n📊 Snapshot A: {comp['snapshot_a']['file']}")
+    lines.append(f"   Version: {comp['snapshot_a']['version']}")
+    lines.append(f"   Date: {comp['snapshot_a']['timestamp']}")
+    lines.append(f"   Total metrics: {comp['snapshot_a']['total_metrics']}")
     
-    print("\n" + "-" * 60)
-    print("SUMMARY")
-    print("-" * 60)
+    lines.append(f"\n📊 Snapshot B: {comp['snapshot_b']['file']}")
+    lines.append(f"   Version: {comp['snapshot_b']['version']}")
+    lines.append(f"   Date: {comp['snapshot_b']['timestamp']}")
+    lines.append(f"   Total metrics: {comp['snapshot_b']['total_metrics']}")
+    
+    lines.append("\n" + "-" * 60)
+    lines.append("SUMMARY")
+    lines.append("-" * 60)
     
     summary = comp["summary"]
-    print(f"✅ Common metrics:        {summary['common_metrics']}")
-    print(f"🔵 Unique to Snapshot A:  {summary['unique_to_a']}")
-    print(f"🟢 Unique to Snapshot B:  {summary['unique_to_b']}")
+    lines.append(f"✅ Common metrics:        {summary['common_metrics']}")
+    lines.append(f"🔵 Unique to Snapshot A:  {summary['unique_to_a']}")
+    lines.append(f"🟢 Unique to Snapshot B:  {summary['unique_to_b']}")
     
     if verbose or summary["unique_to_a"] <= 50:
         if result["unique_to_snapshot_a"]:
-            print("\n" + "-" * 60)
-            print("🔵 METRICS UNIQUE TO SNAPSHOT A (missing in B)")
-            print("-" * 60)
-            for metric in result["unique_to_snapshot_a"]:
-                print(f"  - {metric}")
+            lines.append("\n" + "-" * 60)
+            lines.append("🔵 METRICS UNIQUE TO SNAPSHOT A (missing in B)")
+            lines.append("-" * 60)
+            lines.extend(f"  - {metric}" for metric in result["unique_to_snapshot_a"])
     
     if verbose or summary["unique_to_b"] <= 50:
         if result["unique_to_snapshot_b"]:
-            print("\n" + "-" * 60)
-            print("🟢 METRICS UNIQUE TO SNAPSHOT B (missing in A)")
-            print("-" * 60)
-            for metric in result["unique_to_snapshot_b"]:
-                print(f"  + {metric}")
+            lines.append("\n" + "-" * 60)
+            lines.append("🟢 METRICS UNIQUE TO SNAPSHOT B (missing in A)")
+            lines.append("-" * 60)
+            lines.extend(f"  + {metric}" for metric in result["unique_to_snapshot_b"])
+    
+    lines.append("\n" + "=" * 60)
     
-    print("\n" + "=" * 60)
+    sys.stdout.write("\n".join(lines) + "\n")
+
+
+def _format_list_row(item: tuple) -> str:
+    """Format one (path, stat) snapshot entry as a `list` table row."""
+    snap_path, st = item
+    try:
+        meta = _load_snapshot_metadata_only(snap_path, st)
+        version = meta.get("platform_version", "?")
+        count = meta.get("metrics_count", "?")
+        timestamp = meta.get("timestamp", "?")[:19]
+        return f"{snap_path.name:<45} {version:<15} {count:<10} {timestamp}"
+    except Exception as e:
+        return f"{snap_path.name:<45} {'ERROR':<15} {'-':<10} {str(e)[:20]}"
 
 
 def cmd_list(args):
@@ -356,25 +883,24 @@ def cmd_list(args):
         print("No snapshots directory found", file=sys.stderr)
         return 1
     
-    snapshots = sorted(SNAPSHOTS_DIR.glob("*.yaml"), key=lambda p: p.stat().st_mtime, reverse=True)
+    snapshots = scan_snapshots()
     
     if not snapshots:
         print("No snapshots found", file=sys.stderr)
         return 0
     
+    on_disk_cache = load_meta_cache()
+    
     print(f"\n{'Snapshot File':<45} {'Version':<15} {'Metrics':<10} {'Date'}")
     print("-" * 90)
     
-    for snap_path in snapshots:
-        try:
-            snap = load_snapshot(snap_path)
-            meta = snap.get("metadata", {})
-            version = meta.get("platform_version", "?")
-            count = meta.get("metrics_count", "?")
-            timestamp = meta.get("timestamp", "?")[:19]
-            print(f"{snap_path.name:<45} {version:<15} {count:<10} {timestamp}")
-        except Exception as e:
-            print(f"{snap_path.name:<45} {'ERROR':<15} {'-':<10} {str(e)[:20]}")
+    # Reads are I/O bound, so load cache misses in parallel; map keeps order
+    max_workers = min(8, (os.cpu_count() or 1) * 2)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for row in executor.map(_format_list_row, snapshots):
+            print(row)
+    
+    save_meta_cache({snap_path.name for snap_path, _ in snapshots}, on_disk_cache)
     
     print()
     return 0
@@ -390,14 +916,20 @@ Examples:
   %(prog)s snapshot
   
   # Take a snapshot with custom output
-  %(prog)s snapshot -o my-snapshot.yaml
+  %(prog)s snapshot -o my-snapshot.json
   
-  # Compare two snapshots
-  %(prog)s compare snapshots/v0.64.0.yaml snapshots/v0.65.0.yaml
+  # Take 5 snapshots, 10 minutes apart, over one port-forward
+  %(prog)s snapshot-many --count 5 --every 600
+  
+  # Compare two snapshots (JSON or legacy YAML)
+  %(prog)s compare snapshots/v0.64.0.yaml snapshots/v0.65.0.json
   
   # Compare latest snapshot with another
   %(prog)s compare latest snapshots/v0.64.0.yaml
   
+  # Compare every pair of saved snapshots
+  %(prog)s matrix
+  
   # List all snapshots
   %(prog)s list
 """
@@ -405,16 +937,27 @@ Examples:
     
     subparsers = parser.add_subparsers(dest="command", help="Commands")
     
+    # Options shared by the snapshot commands
+    prom_parser = argparse.ArgumentParser(add_help=False)
+    prom_parser.add_argument("-u", "--url", help="Prometheus URL (skip port-forward)")
+    prom_parser.add_argument("-n", "--namespace", help="Prometheus namespace")
+    prom_parser.add_argument("-s", "--service", help="Prometheus service name")
+    prom_parser.add_argument("-p", "--port", type=int, help="Prometheus port")
+    prom_parser.add_argument("--cluster-path", help="Path to cluster directory (for version info)")
+    
     # Snapshot command
-    snap_parser = subparsers.add_parser("snapshot", help="Take a metrics snapshot")
-    snap_parser.add_argument("-o", "--output", help="Output file path")
-    snap_parser.add_argument("-u", "--url", help="Prometheus URL (skip port-forward)")
-    snap_parser.add_argument("-n", "--namespace", help="Prometheus namespace")
-    snap_parser.add_argument("-s", "--service", help="Prometheus service name")
-    snap_parser.add_argument("-p", "--port", type=int, help="Prometheus port")
-    snap_parser.add_argument("--cluster-path", help="Path to cluster directory (for version info)")
+    snap_parser = subparsers.add_parser("snapshot", parents=[prom_parser], help="Take a metrics snapshot")
+    snap_parser.add_argument("-o", "--output", help="Output file path (.json, or .yaml for YAML)")
     snap_parser.add_argument("--json", action="store_true", help="Output as JSON")
     
+    # Snapshot-many command
+    many_parser = subparsers.add_parser(
+        "snapshot-many", parents=[prom_parser],
+        help="Take repeated snapshots over one port-forward"
+    )
+    many_parser.add_argument("-c", "--count", type=int, help="Number of snapshots (default: until interrupted)")
+    many_parser.add_argument("-e", "--every", type=int, default=60, help="Seconds between snapshots (default: 60)")
+    
     # Compare command
     cmp_parser = subparsers.add_parser("compare", help="Compare two snapshots")
     cmp_parser.add_argument("snapshot_a", help="First snapshot file (or 'latest')")
@@ -422,6 +965,12 @@ Examples:
     cmp_parser.add_argument("--json", action="store_true", help="Output as JSON")
     cmp_parser.add_argument("-v", "--verbose", action="store_true", help="Show all metrics")
     
+    # Matrix command
+    matrix_parser = subparsers.add_parser("matrix", help="Compare every pair among several snapshots")
+    matrix_parser.add_argument("snapshots", nargs="*", help="Snapshot files (default: all saved snapshots)")
+    matrix_parser.add_argument("--json", action="store_true", help="Output as JSON")
+    matrix_parser.add_argument("-v", "--verbose", action="store_true", help="Show differing metrics per pair")
+    
     # List command
     list_parser = subparsers.add_parser("list", help="List available snapshots")
     
@@ -429,8 +978,12 @@ Examples:
     
     if args.command == "snapshot":
         return cmd_snapshot(args)
+    elif args.command == "snapshot-many":
+        return cmd_snapshot_many(args)
     elif args.command == "compare":
         return cmd_compare(args)
+    elif args.command == "matrix":
+        return cmd_matrix(args)
     elif args.command == "list":
         return cmd_list(args)
     else: